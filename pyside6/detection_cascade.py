@@ -0,0 +1,304 @@
+import json
+import os
+import time
+
+import cv2
+
+from model_variants import prepare_variant, is_fixed_size
+
+# 级联检测默认配置（可被 cascade.json 覆盖）
+DEFAULT_CASCADE_CONFIG = {
+    'gate_model': 'yolov8n.pt',      # 第一级：快速门控模型，每帧都运行
+    'gate_variant': 'fp32',          # 门控模型变体: fp32 / fp32_320 / int8 / int8_320 等
+    'variant_calib_data': 'coco8.yaml',  # 生成INT8变体时使用的校准数据集
+    'refine_enabled': False,         # 是否启用第二级精细模型
+    'refine_model': 'yolov8s.pt',    # 第二级：较大的检测或分类模型，只处理裁剪区域
+    'refine_task': 'detect',         # 第二级模型类型: detect / classify
+    'escalate_classes': [],          # 触发二级检测的类别名称
+    'escalate_min_conf': 0.25,       # 门控检测置信度低于该值时不升级
+    'crop_padding': 0.15,            # 裁剪区域向外扩展的比例
+    'refine_imgsz': 320,             # 第二级模型的输入尺寸
+    'max_crops': 8,                  # 每帧最多送入二级模型的裁剪数量
+    'min_crop_size': 16,             # 裁剪区域的最小边长（像素），更小的不升级
+    'refine_min_iou': 0.3,           # 二级检测框与门控框的最小IoU，低于该值保留门控结果
+}
+
+# 每个会话的检测设置（直接传入模型调用，由NMS阶段完成过滤）
+DEFAULT_DETECTION_SETTINGS = {
+    'classes': [],       # 类别白名单（名称），为空表示全部类别
+    'conf': 0.25,        # 置信度阈值
+    'iou': 0.7,          # NMS的IoU阈值
+    'max_det': 100,      # 每帧最大检测数量
+    'imgsz': 640,        # 输入尺寸
+}
+
+
+def load_cascade_config(config_file='cascade.json'):
+    """加载级联配置，缺失的字段使用默认值"""
+    config = dict(DEFAULT_CASCADE_CONFIG)
+    if os.path.exists(config_file):
+        with open(config_file, 'r', encoding='utf-8') as f:
+            config.update(json.load(f))
+    return config
+
+
+class StageStats:
+    """记录各阶段耗时，用于调整升级类别"""
+
+    def __init__(self):
+        self.frames = 0
+        self.gate_ms = 0.0
+        self.refine_ms = 0.0
+        self.refine_calls = 0
+        self.crops = 0
+        self.escalations = {}   # 类别 -> 升级次数
+        self.relabels = {}      # 类别 -> 被二级模型修正的次数
+
+    @classmethod
+    def merge(cls, stats_list):
+        """合并多个处理线程的统计"""
+        merged = cls()
+        for stats in stats_list:
+            merged.frames += stats.frames
+            merged.gate_ms += stats.gate_ms
+            merged.refine_ms += stats.refine_ms
+            merged.refine_calls += stats.refine_calls
+            merged.crops += stats.crops
+            for label, count in stats.escalations.items():
+                merged.escalations[label] = merged.escalations.get(label, 0) + count
+            for label, count in stats.relabels.items():
+                merged.relabels[label] = merged.relabels.get(label, 0) + count
+        return merged
+
+    def summary(self):
+        """生成耗时统计文本"""
+        if self.frames == 0:
+            return "级联统计: 暂无数据"
+        lines = [
+            f"门控模型: 平均 {self.gate_ms / self.frames:.1f} ms/帧 ({self.frames} 帧)",
+        ]
+        if self.refine_calls:
+            lines.append(
+                f"精细模型: 平均 {self.refine_ms / self.refine_calls:.1f} ms/批, "
+                f"{self.crops / self.refine_calls:.1f} 个裁剪/批, "
+                f"摊销 {self.refine_ms / self.frames:.1f} ms/帧"
+            )
+        else:
+            lines.append("精细模型: 未触发")
+        if self.escalations:
+            per_class = ", ".join(
+                f"{label}×{count}(修正{self.relabels.get(label, 0)})"
+                for label, count in sorted(self.escalations.items(), key=lambda item: -item[1])
+            )
+            lines.append(f"升级类别: {per_class}")
+        return "\n".join(lines)
+
+
+class DetectionCascade:
+    """两级检测级联：快速模型处理整帧，较大模型只处理选中类别的裁剪区域"""
+
+    def __init__(self, config=None):
+        self.config = dict(DEFAULT_CASCADE_CONFIG)
+        if config:
+            self.config.update(config)
+        self.gate_model = None
+        self.gate_imgsz = None     # 量化变体固定的输入尺寸，为空时使用检测设置
+        self.default_imgsz = None  # 变体建议的默认输入尺寸，可被检测设置覆盖
+        self.refine_model = None
+        self.stats = StageStats()
+
+    def load(self):
+        """加载模型（耗时操作，应在后台线程中调用）"""
+        from ultralytics import YOLO
+        path, self.default_imgsz = prepare_variant(self.config['gate_model'], self.config['gate_variant'],
+                                                   self.config['variant_calib_data'])
+        if is_fixed_size(self.config['gate_variant']):
+            self.gate_imgsz = self.default_imgsz
+        self.gate_model = YOLO(path, task='detect')
+        if self.config['refine_enabled'] and self.config['escalate_classes']:
+            self.refine_model = YOLO(self.config['refine_model'])
+            # 模型类型与配置不一致时合并结果会全部失败，但仍然产生二级模型的开销
+            if self.refine_model.task != self.config['refine_task']:
+                raise ValueError(
+                    f"精细模型 {self.config['refine_model']} 的类型为 {self.refine_model.task}，"
+                    f"与配置的 refine_task={self.config['refine_task']} 不一致")
+
+    @property
+    def names(self):
+        return self.gate_model.names
+
+    def describe(self):
+        """返回当前级联配置的描述文本"""
+        text = f"门控模型: {self.config['gate_model']} ({self.config['gate_variant']})"
+        if self.gate_imgsz:
+            text += f", 固定输入尺寸 {self.gate_imgsz}"
+        if self.refine_model is not None:
+            text += (f"\n精细模型: {self.config['refine_model']} ({self.config['refine_task']})"
+                     f"\n升级类别: {', '.join(self.config['escalate_classes'])}")
+        return text
+
+    def class_ids(self, class_names):
+        """将类别名称转换为门控模型的类别ID，忽略未知名称"""
+        lookup = {name: cls_id for cls_id, name in self.names.items()}
+        return [lookup[name] for name in class_names if name in lookup]
+
+    def unknown_classes(self, class_names):
+        """返回门控模型中不存在的类别名称"""
+        known = set(self.names.values())
+        return [name for name in class_names if name not in known]
+
+    def predict_kwargs(self, settings):
+        """根据检测设置生成门控模型的调用参数"""
+        kwargs = {
+            'conf': settings['conf'],
+            'iou': settings['iou'],
+            'max_det': settings['max_det'],
+            'imgsz': self.gate_imgsz or settings['imgsz'],
+            'verbose': False,
+        }
+        # 未知名称被忽略；全部未知时不过滤类别，避免输入错误导致画面上没有任何检测框
+        class_ids = self.class_ids(settings['classes'])
+        if class_ids:
+            kwargs['classes'] = class_ids
+        return kwargs
+
+    def filter_detections(self, detections, settings):
+        """对合并后的结果重新应用检测设置（二级模型可能修改了类别和置信度）"""
+        allowed = set(settings['classes']) - set(self.unknown_classes(settings['classes']))
+        return [
+            det for det in detections
+            if det['conf'] >= settings['conf'] and (not allowed or det['label'] in allowed)
+        ]
+
+    def run(self, frame, settings=None):
+        """对一帧执行级联检测，返回检测列表
+
+        每个检测为字典: label, cls_id, conf, box(x1, y1, x2, y2), stage
+        cls_id 属于产生该标签的模型（stage 为 refine 时是精细模型的类别ID）
+        """
+        settings = settings or DEFAULT_DETECTION_SETTINGS
+        start = time.perf_counter()
+        results = self.gate_model(frame, **self.predict_kwargs(settings))[0]
+        self.stats.gate_ms += (time.perf_counter() - start) * 1000
+        self.stats.frames += 1
+
+        detections = []
+        if results.boxes is not None:
+            for box in results.boxes:
+                cls_id = int(box.cls[0])
+                detections.append({
+                    'label': results.names[cls_id],
+                    'cls_id': cls_id,
+                    'conf': float(box.conf[0]),
+                    'box': [float(v) for v in box.xyxy[0]],
+                    'stage': 'gate',
+                })
+
+        if self.refine_model is not None:
+            self._refine(frame, detections)
+            detections = self.filter_detections(detections, settings)
+        return detections
+
+    def _refine(self, frame, detections):
+        """将选中类别的裁剪区域批量送入二级模型，并合并结果"""
+        escalate = set(self.config['escalate_classes'])
+        candidates = [
+            det for det in detections
+            if det['label'] in escalate and det['conf'] >= self.config['escalate_min_conf']
+        ]
+        if not candidates:
+            return
+        candidates.sort(key=lambda det: det['conf'], reverse=True)
+        candidates = candidates[:self.config['max_crops']]
+
+        h, w = frame.shape[:2]
+        pad = self.config['crop_padding']
+        min_size = self.config['min_crop_size']
+        crops, offsets, escalated = [], [], []
+        for det in candidates:
+            x1, y1, x2, y2 = det['box']
+            dx, dy = (x2 - x1) * pad, (y2 - y1) * pad
+            cx1, cy1 = max(0, int(x1 - dx)), max(0, int(y1 - dy))
+            cx2, cy2 = min(w, int(x2 + dx)), min(h, int(y2 + dy))
+            # 过小或位于画面边缘被截断的区域会产生空裁剪，直接保留门控结果
+            if cx2 - cx1 < min_size or cy2 - cy1 < min_size:
+                continue
+            crops.append(frame[cy1:cy2, cx1:cx2])
+            offsets.append((cx1, cy1))
+            escalated.append(det)
+            self.stats.escalations[det['label']] = self.stats.escalations.get(det['label'], 0) + 1
+        if not crops:
+            return
+
+        start = time.perf_counter()
+        refined = self.refine_model(crops, imgsz=self.config['refine_imgsz'], verbose=False)
+        self.stats.refine_ms += (time.perf_counter() - start) * 1000
+        self.stats.refine_calls += 1
+        self.stats.crops += len(crops)
+
+        for det, offset, result in zip(escalated, offsets, refined):
+            if self.config['refine_task'] == 'classify':
+                self._merge_classification(det, result)
+            else:
+                self._merge_detection(det, offset, result)
+
+    def _merge_classification(self, det, result):
+        """用分类结果替换门控模型的标签"""
+        if result.probs is None:
+            return
+        cls_id = int(result.probs.top1)
+        self._apply_refined(det, cls_id, result.names[cls_id], float(result.probs.top1conf), det['box'])
+
+    def _merge_detection(self, det, offset, result):
+        """用与门控框重叠最大的检测替换门控结果，坐标映射回整帧
+
+        裁剪区域中可能包含相邻目标，因此按IoU而不是置信度选择，IoU不足时保留门控结果。
+        """
+        if result.boxes is None or len(result.boxes) == 0:
+            return
+        ox, oy = offset
+        gx1, gy1, gx2, gy2 = det['box']
+        gate_box = [gx1 - ox, gy1 - oy, gx2 - ox, gy2 - oy]
+        best, best_iou = None, self.config['refine_min_iou']
+        for box in result.boxes:
+            iou = box_iou(gate_box, [float(v) for v in box.xyxy[0]])
+            if iou >= best_iou:
+                best, best_iou = box, iou
+        if best is None:
+            return
+        x1, y1, x2, y2 = [float(v) for v in best.xyxy[0]]
+        cls_id = int(best.cls[0])
+        self._apply_refined(det, cls_id, result.names[cls_id], float(best.conf[0]),
+                            [x1 + ox, y1 + oy, x2 + ox, y2 + oy])
+
+    def _apply_refined(self, det, cls_id, label, conf, box):
+        if label != det['label']:
+            self.stats.relabels[det['label']] = self.stats.relabels.get(det['label'], 0) + 1
+        det['cls_id'] = cls_id
+        det['label'] = label
+        det['conf'] = conf
+        det['box'] = box
+        det['stage'] = 'refine'
+
+
+def box_iou(a, b):
+    """计算两个 (x1, y1, x2, y2) 检测框的IoU"""
+    w = min(a[2], b[2]) - max(a[0], b[0])
+    h = min(a[3], b[3]) - max(a[1], b[1])
+    if w <= 0 or h <= 0:
+        return 0.0
+    inter = w * h
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def draw_detections(frame, detections):
+    """在图像上绘制检测框，精细模型的结果用不同颜色标出"""
+    img = frame.copy()
+    for det in detections:
+        x1, y1, x2, y2 = [int(v) for v in det['box']]
+        color = (255, 152, 0) if det['stage'] == 'refine' else (33, 150, 243)
+        cv2.rectangle(img, (x1, y1), (x2, y2), color, 1)
+        cv2.putText(img, f"{det['label']} {det['conf']:.2f}", (x1, max(y1 - 4, 10)),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.45, color, 1, cv2.LINE_AA)
+    return img
@@ -6,6 +6,10 @@ import numpy as np
 import os
 import time
 from threading import Thread, Lock
+from detection_cascade import (DetectionCascade, DEFAULT_DETECTION_SETTINGS,
+                               StageStats, load_cascade_config, draw_detections)
+from rule_engine import load_rule_engine
+from thread_tuning import load_profile, apply_profile, describe_profile
 
 # 设置YOLO不输出调试信息
 os.environ['YOLO_VERBOSE'] = 'False'
@@ -16,6 +20,8 @@ class DetectionSignals(QObject):
     update_result_text = Signal(str)        # 更新检测结果文本
     update_status_text = Signal(str)        # 更新状态文本
     update_info_text = Signal(str)          # 更新信息文本
+    update_profile_text = Signal(str)       # 更新线程配置文本
+    update_imgsz = Signal(int, bool)        # 同步模型变体的输入尺寸（尺寸, 是否固定）
 
 class DetectionWindow(QMainWindow):
     def __init__(self, username, app_manager):
@@ -28,9 +34,17 @@ class DetectionWindow(QMainWindow):
         
         # YOLO相关
         self.frameToAnalyze = []
+        self.frame_seq = 0           # 送入处理队列的帧序号
+        self.last_emitted_seq = 0    # 最近一次输出结果的帧序号
+        self.analyzed_count = 0
         self.detection_results = []
         self.model = None
+        self.cascade = None
+        self.cascades = []
+        self.detection_settings = dict(DEFAULT_DETECTION_SETTINGS)  # 本次会话的检测设置
+        self.rule_engine = None
         self.lock = Lock()  # 线程锁
+        self.result_lock = Lock()  # 多个处理线程按帧序输出结果、共享规则引擎
         
         # 创建信号对象
         self.signals = DetectionSignals()
@@ -42,6 +56,11 @@ class DetectionWindow(QMainWindow):
         self.signals.update_result_text.connect(self.update_result_text)
         self.signals.update_status_text.connect(self.update_status_text)
         self.signals.update_info_text.connect(self.update_info_text)
+        self.signals.update_profile_text.connect(self.update_profile_text)
+        self.signals.update_imgsz.connect(self.update_imgsz)
+        
+        # 加载告警规则
+        self.load_rules()
         
         # 启动YOLO处理线程（在后台加载模型）
         Thread(target=self.load_yolo_model, daemon=True).start()
@@ -149,6 +168,49 @@ class DetectionWindow(QMainWindow):
         button_layout.addStretch()
         button_layout.addWidget(logout_btn)
         
+        # 检测设置面板（实时生效，无需重新加载模型）
+        settings_group = QGroupBox("检测设置")
+        settings_layout = QHBoxLayout()
+        
+        self.classes_edit = QLineEdit()
+        self.classes_edit.setPlaceholderText('类别白名单，逗号分隔，如 person,car（留空为全部）')
+        self.classes_edit.editingFinished.connect(self.apply_detection_settings)
+        
+        self.conf_spin = QDoubleSpinBox()
+        self.conf_spin.setRange(0.01, 1.0)
+        self.conf_spin.setSingleStep(0.05)
+        self.conf_spin.setValue(self.detection_settings['conf'])
+        self.conf_spin.valueChanged.connect(self.apply_detection_settings)
+        
+        self.iou_spin = QDoubleSpinBox()
+        self.iou_spin.setRange(0.05, 1.0)
+        self.iou_spin.setSingleStep(0.05)
+        self.iou_spin.setValue(self.detection_settings['iou'])
+        self.iou_spin.valueChanged.connect(self.apply_detection_settings)
+        
+        self.max_det_spin = QSpinBox()
+        self.max_det_spin.setRange(1, 300)
+        self.max_det_spin.setValue(self.detection_settings['max_det'])
+        self.max_det_spin.valueChanged.connect(self.apply_detection_settings)
+        
+        self.imgsz_combo = QComboBox()
+        for size in (320, 416, 512, 640):
+            self.imgsz_combo.addItem(str(size), size)
+        self.imgsz_combo.setCurrentText(str(self.detection_settings['imgsz']))
+        self.imgsz_combo.currentIndexChanged.connect(self.apply_detection_settings)
+        
+        settings_layout.addWidget(QLabel('类别:'))
+        settings_layout.addWidget(self.classes_edit, 1)
+        settings_layout.addWidget(QLabel('置信度:'))
+        settings_layout.addWidget(self.conf_spin)
+        settings_layout.addWidget(QLabel('IoU:'))
+        settings_layout.addWidget(self.iou_spin)
+        settings_layout.addWidget(QLabel('最大数量:'))
+        settings_layout.addWidget(self.max_det_spin)
+        settings_layout.addWidget(QLabel('输入尺寸:'))
+        settings_layout.addWidget(self.imgsz_combo)
+        settings_group.setLayout(settings_layout)
+        
         # 信息面板
         info_group = QGroupBox("系统信息")
         info_layout = QVBoxLayout()
@@ -157,6 +219,11 @@ class DetectionWindow(QMainWindow):
         self.info_text.setMaximumHeight(100)
         self.update_info_text_signal("系统状态: 就绪")
         
+        # 线程配置常驻显示，不会被告警和统计信息覆盖
+        self.profile_label = QLabel("线程配置: 模型加载后显示")
+        self.profile_label.setStyleSheet('color: #666; font-size: 12px;')
+        
+        info_layout.addWidget(self.profile_label)
         info_layout.addWidget(self.info_text)
         info_group.setLayout(info_layout)
         
@@ -178,6 +245,7 @@ class DetectionWindow(QMainWindow):
         main_layout.addLayout(title_layout)
         main_layout.addLayout(video_layout)
         main_layout.addLayout(button_layout)
+        main_layout.addWidget(settings_group)
         main_layout.addWidget(info_group)
         main_layout.addWidget(result_group)
         main_layout.addWidget(self.status_label)
@@ -193,17 +261,80 @@ class DetectionWindow(QMainWindow):
         try:
             from ultralytics import YOLO
             self.update_status_text_signal("正在加载YOLO模型，请稍候...")
-            self.model = YOLO('yolov8n.pt')
+            
+            # 应用校准得到的线程配置（python main.py --calibrate），模型或变体变化后不再使用
+            config = load_cascade_config()
+            profile = load_profile(model=config['gate_model'], variant=config['gate_variant'])
+            apply_profile(profile)
+            
+            # 每个处理线程使用独立的模型实例
+            cascades = []
+            for _ in range(max(1, profile['workers'])):
+                cascade = DetectionCascade(config)
+                cascade.load()
+                cascades.append(cascade)
+            self.cascades = cascades
+            self.cascade = cascades[0]
+            self.model = self.cascade.gate_model
             self.update_status_text_signal("YOLO模型加载完成")
-            self.update_info_text_signal("YOLO模型已加载")
+            self.update_info_text_signal(f"YOLO模型已加载\n{self.cascade.describe()}")
+            self.signals.update_profile_text.emit(describe_profile(profile))
+            
+            # 量化变体只能使用导出时的输入尺寸，fp32缩小尺寸变体仅作为默认值
+            imgsz = self.cascade.gate_imgsz or self.cascade.default_imgsz
+            if imgsz:
+                self.signals.update_imgsz.emit(imgsz, self.cascade.gate_imgsz is not None)
+            with self.lock:
+                classes = self.detection_settings['classes']
+            self.check_class_names(classes)
             
             # 启动处理线程
-            Thread(target=self.frame_analyze_thread_func, daemon=True).start()
+            for cascade in cascades:
+                Thread(target=self.frame_analyze_thread_func, args=(cascade,), daemon=True).start()
             
         except Exception as e:
             self.update_status_text_signal(f"YOLO模型加载失败: {str(e)}")
             self.update_info_text_signal(f"YOLO模型加载失败: {str(e)}")
             
+    def load_rules(self):
+        """加载告警规则配置"""
+        try:
+            self.rule_engine = load_rule_engine()
+            if self.rule_engine:
+                self.update_info_text_signal(f"已加载 {len(self.rule_engine.rules)} 条告警规则")
+        except Exception as e:
+            self.rule_engine = None
+            self.update_info_text_signal(f"告警规则加载失败: {str(e)}")
+            
+    def apply_detection_settings(self):
+        """槽函数：将界面上的检测设置应用到处理线程"""
+        classes = [name.strip() for name in self.classes_edit.text().split(',') if name.strip()]
+        settings = {
+            'classes': classes,
+            'conf': self.conf_spin.value(),
+            'iou': self.iou_spin.value(),
+            'max_det': self.max_det_spin.value(),
+            'imgsz': self.imgsz_combo.currentData(),
+        }
+        with self.lock:
+            self.detection_settings = settings
+            
+        if self.check_class_names(classes):
+            self.update_status_text_signal("检测设置已更新")
+            
+    def check_class_names(self, classes):
+        """提示未知的类别名称，模型尚未加载时在加载完成后再检查"""
+        if not classes:
+            return True
+        if self.cascade is None or self.cascade.gate_model is None:
+            self.update_status_text_signal("类别白名单将在模型加载完成后校验")
+            return False
+        unknown = self.cascade.unknown_classes(classes)
+        if unknown:
+            self.update_status_text_signal(f"未知类别(已忽略): {', '.join(unknown)}")
+            return False
+        return True
+        
     def update_info_text_signal(self, message):
         """通过信号更新信息面板"""
         current_time = QDateTime.currentDateTime().toString('yyyy-MM-dd hh:mm:ss')
@@ -214,6 +345,19 @@ class DetectionWindow(QMainWindow):
         """槽函数：更新信息面板"""
         self.info_text.setText(message)
         
+    def update_imgsz(self, size, fixed):
+        """槽函数：将输入尺寸控件同步为模型变体的尺寸"""
+        if self.imgsz_combo.findData(size) < 0:
+            self.imgsz_combo.addItem(str(size), size)
+        self.imgsz_combo.setCurrentIndex(self.imgsz_combo.findData(size))
+        self.imgsz_combo.setEnabled(not fixed)
+        if fixed:
+            self.imgsz_combo.setToolTip('当前模型变体使用固定输入尺寸')
+            
+    def update_profile_text(self, text):
+        """槽函数：更新线程配置文本"""
+        self.profile_label.setText(text)
+        
     def update_status_text_signal(self, message):
         """通过信号更新状态文本"""
         self.signals.update_status_text.emit(message)
@@ -267,35 +411,31 @@ class DetectionWindow(QMainWindow):
                 if self.is_detecting and self.model:
                     with self.lock:
                         if len(self.frameToAnalyze) == 0:
-                            self.frameToAnalyze.append(frame_rgb)
+                            self.frame_seq += 1
+                            self.frameToAnalyze.append((self.frame_seq, frame_rgb))
                     
-    def frame_analyze_thread_func(self):
+    def frame_analyze_thread_func(self, cascade):
         """YOLO处理线程"""
         while True:
             frame = None
             with self.lock:
                 if self.frameToAnalyze:
-                    frame = self.frameToAnalyze.pop(0)
+                    seq, frame = self.frameToAnalyze.pop(0)
+                settings = self.detection_settings
             
             if frame is None:
                 time.sleep(0.01)
                 continue
                 
             try:
-                # 进行YOLO检测
-                results = self.model(frame)[0]
+                # 进行级联YOLO检测
+                detections = cascade.run(frame, settings)
                 
                 # 获取检测结果
-                detected_objects = []
-                if hasattr(results, 'boxes'):
-                    for box in results.boxes:
-                        cls_id = int(box.cls[0])
-                        conf = float(box.conf[0])
-                        label = results.names[cls_id]
-                        detected_objects.append(f"{label}: {conf:.2f}")
+                detected_objects = [f"{det['label']}: {det['conf']:.2f}" for det in detections]
                 
                 # 绘制检测结果
-                img = results.plot(line_width=1)
+                img = draw_detections(frame, detections)
                 
                 # 更新检测结果文本
                 if detected_objects:
@@ -305,14 +445,31 @@ class DetectionWindow(QMainWindow):
                 else:
                     result_text = "未检测到对象"
                     
-                # 通过信号更新UI
-                self.signals.update_result_text.emit(result_text)
-                
                 # 显示检测后的画面
                 h, w, ch = img.shape
                 bytes_per_line = ch * w
                 qImage = QImage(img.data, w, h, bytes_per_line, QImage.Format_RGB888)
-                self.signals.update_treated_image.emit(qImage)
+                
+                with self.result_lock:
+                    # 多个处理线程时，丢弃比已输出结果更旧的帧，保证画面和规则引擎按帧序更新
+                    if seq <= self.last_emitted_seq:
+                        continue
+                    self.last_emitted_seq = seq
+                    
+                    # 通过信号更新UI
+                    self.signals.update_result_text.emit(result_text)
+                    self.signals.update_treated_image.emit(qImage)
+                    
+                    # 评估告警规则（动作在后台线程中执行）
+                    if self.rule_engine:
+                        for event in self.rule_engine.process(detections, img):
+                            self.update_info_text_signal(f"⚠️ 告警: {event['message']}")
+                    
+                    # 定期在信息面板报告所有处理线程的各阶段耗时
+                    self.analyzed_count += 1
+                    if self.analyzed_count % 50 == 0:
+                        stats = StageStats.merge([c.stats for c in self.cascades])
+                        self.update_info_text_signal(stats.summary())
                 
             except Exception as e:
                 print(f"YOLO检测错误: {e}")
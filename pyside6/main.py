@@ -41,6 +41,13 @@ class AppManager:
             self.show_login()
 
 def main():
+    # 校准模式：基准测试推理线程配置并保存，不启动界面
+    # 其余参数（--images、--max-workers 等）转交给 thread_tuning
+    if '--calibrate' in sys.argv:
+        import thread_tuning
+        thread_tuning.main([arg for arg in sys.argv[1:] if arg != '--calibrate'])
+        return
+        
     app = QApplication(sys.argv)
     app.setStyle('Fusion')  # 设置统一的样式
     
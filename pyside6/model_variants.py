@@ -0,0 +1,198 @@
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import statistics
+import time
+
+import cv2
+import numpy as np
+
+CACHE_DIR = 'model_cache'
+
+# 模型变体：int8 表示导出为 INT8 量化的 OpenVINO 模型（输入尺寸固定）；
+# fp32 变体的 imgsz 只是默认输入尺寸，可被会话的检测设置覆盖
+MODEL_VARIANTS = {
+    'fp32': {'int8': False, 'imgsz': None},
+    'fp32_416': {'int8': False, 'imgsz': 416},
+    'fp32_320': {'int8': False, 'imgsz': 320},
+    'int8': {'int8': True, 'imgsz': 640},
+    'int8_416': {'int8': True, 'imgsz': 416},
+    'int8_320': {'int8': True, 'imgsz': 320},
+}
+
+
+def is_fixed_size(variant):
+    """导出的量化模型只能使用导出时的输入尺寸"""
+    return MODEL_VARIANTS[variant]['int8']
+
+
+def variant_cache_path(model_path, variant, calib_data, cache_dir=CACHE_DIR):
+    """返回量化变体在缓存目录中的路径
+
+    路径中包含权重文件内容和校准数据集的摘要，替换权重或更换校准数据后会重新导出。
+    """
+    digest = hashlib.sha1()
+    with open(model_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    digest.update(calib_data.encode('utf-8'))
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    spec = MODEL_VARIANTS[variant]
+    return os.path.join(cache_dir, f"{stem}_int8_{spec['imgsz']}_{digest.hexdigest()[:12]}_openvino_model")
+
+
+def prepare_variant(model_path, variant='fp32', calib_data='coco8.yaml', cache_dir=CACHE_DIR):
+    """生成（或从缓存读取）模型变体，返回 (模型路径, 输入尺寸)
+
+    fp32 变体直接使用原模型，只改变输入尺寸；int8 变体首次使用时导出并缓存。
+    """
+    if variant not in MODEL_VARIANTS:
+        raise ValueError(f"未知的模型变体: {variant}，可选: {', '.join(MODEL_VARIANTS)}")
+    spec = MODEL_VARIANTS[variant]
+    if not spec['int8']:
+        return model_path, spec['imgsz']
+
+    from ultralytics import YOLO
+    if not os.path.exists(model_path):
+        # 官方权重在首次加载时自动下载，之后才能计算缓存摘要
+        YOLO(model_path)
+    cached = variant_cache_path(model_path, variant, calib_data, cache_dir)
+    if not os.path.isdir(cached):
+        try:
+            exported = YOLO(model_path).export(format='openvino', int8=True,
+                                               imgsz=spec['imgsz'], data=calib_data)
+        except ImportError as e:
+            raise ImportError(f"生成INT8变体需要 OpenVINO 导出依赖，请先安装: pip install openvino nncf ({e})") from e
+        os.makedirs(cache_dir, exist_ok=True)
+        shutil.move(str(exported), cached)
+    return cached, spec['imgsz']
+
+
+def load_images(image_dir):
+    """读取评估图片（RGB，与检测窗口中送入模型的格式一致）"""
+    images = []
+    for name in sorted(os.listdir(image_dir)):
+        img = cv2.imread(os.path.join(image_dir, name))
+        if img is not None:
+            images.append(cv2.cvtColor(img, cv2.COLOR_BGR2RGB))
+    return images
+
+
+def extract_boxes(results):
+    """提取检测框和类别，返回 (boxes[N, 4], classes[N])"""
+    if results.boxes is None or len(results.boxes) == 0:
+        return np.zeros((0, 4)), np.zeros(0, dtype=int)
+    return results.boxes.xyxy.cpu().numpy(), results.boxes.cls.cpu().numpy().astype(int)
+
+
+def box_iou_matrix(a, b):
+    """计算两组检测框的IoU矩阵"""
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+def match_count(reference, candidate, iou_threshold=0.5):
+    """贪心匹配同类别且IoU超过阈值的检测框，返回匹配数量"""
+    ref_boxes, ref_cls = reference
+    cand_boxes, cand_cls = candidate
+    if len(ref_boxes) == 0 or len(cand_boxes) == 0:
+        return 0
+    iou = box_iou_matrix(ref_boxes, cand_boxes)
+    iou[ref_cls[:, None] != cand_cls[None, :]] = 0
+    matched = 0
+    while True:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        if iou[i, j] < iou_threshold:
+            return matched
+        matched += 1
+        iou[i, :] = 0
+        iou[:, j] = 0
+
+
+def evaluate_variant(model, images, imgsz, reference=None, warmup=2):
+    """在图片集上运行一个变体，返回速度统计和与参考结果的一致性"""
+    kwargs = {'verbose': False}
+    if imgsz:
+        kwargs['imgsz'] = imgsz
+    for img in images[:warmup]:
+        model(img, **kwargs)
+
+    latencies, outputs = [], []
+    for img in images:
+        start = time.perf_counter()
+        results = model(img, **kwargs)[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        outputs.append(extract_boxes(results))
+
+    latencies.sort()
+    report = {
+        'imgsz': imgsz,
+        'fps': 1000 / statistics.mean(latencies),
+        'mean_ms': statistics.mean(latencies),
+        'p95_ms': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+    }
+    if reference is not None:
+        matched = sum(match_count(ref, out) for ref, out in zip(reference, outputs))
+        ref_total = sum(len(ref[1]) for ref in reference)
+        out_total = sum(len(out[1]) for out in outputs)
+        precision = matched / out_total if out_total else 1.0
+        recall = matched / ref_total if ref_total else 1.0
+        report.update(
+            precision=precision,
+            recall=recall,
+            agreement=2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        )
+    return report, outputs
+
+
+def evaluate(model_path, image_dir, variants=None, calib_data='coco8.yaml', report_file=None):
+    """评估各模型变体相对全精度模型的速度和检测一致性"""
+    from ultralytics import YOLO
+    images = load_images(image_dir)
+    if not images:
+        raise ValueError(f"目录中没有可用的图片: {image_dir}")
+    variants = variants or list(MODEL_VARIANTS)
+
+    # 全精度模型作为参考
+    reference_report, reference = evaluate_variant(YOLO(model_path), images, None)
+    reports = {'fp32': dict(reference_report, precision=1.0, recall=1.0, agreement=1.0)}
+    for variant in variants:
+        if variant == 'fp32':
+            continue
+        path, imgsz = prepare_variant(model_path, variant, calib_data)
+        reports[variant], _ = evaluate_variant(YOLO(path, task='detect'), images, imgsz, reference)
+
+    print(f"模型: {model_path}  图片: {len(images)} 张")
+    print(f"{'变体':<10}{'fps':>8}{'平均ms':>10}{'p95ms':>10}{'一致性':>10}{'召回':>8}")
+    for variant, report in reports.items():
+        print(f"{variant:<10}{report['fps']:>8.1f}{report['mean_ms']:>10.1f}{report['p95_ms']:>10.1f}"
+              f"{report['agreement']:>10.3f}{report['recall']:>8.3f}")
+
+    if report_file:
+        with open(report_file, 'w', encoding='utf-8') as f:
+            json.dump({'model': model_path, 'images': len(images), 'variants': reports},
+                      f, indent=2, ensure_ascii=False)
+    return reports
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='模型变体生成与速度/精度评估')
+    parser.add_argument('--model', default='yolov8n.pt')
+    parser.add_argument('--images', required=True, help='本地评估图片目录')
+    parser.add_argument('--variants', nargs='*', choices=list(MODEL_VARIANTS), default=None)
+    parser.add_argument('--calib-data', default='coco8.yaml', help='INT8 量化校准数据集')
+    parser.add_argument('--report', default='variant_report.json')
+    args = parser.parse_args(argv)
+    evaluate(args.model, args.images, args.variants, args.calib_data, args.report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import json
+import os
+import queue
+import time
+import urllib.request
+from threading import Thread
+
+# 规则类型
+#   zone : 区域内出现指定类别（持续 hold 秒后触发）
+#   count: 指定类别数量超过阈值（可限定区域）
+#   dwell: 区域持续被占用超过 duration 秒
+RULE_TYPES = ('zone', 'count', 'dwell')
+
+# 告警动作
+RULE_ACTIONS = ('snapshot', 'log', 'webhook')
+
+
+class Rule:
+    """单条告警规则及其增量状态"""
+
+    def __init__(self, config):
+        self.name = config['name']
+        self.type = config.get('type', 'zone')
+        if self.type not in RULE_TYPES:
+            raise ValueError(f"规则 {self.name} 类型无效: {self.type}")
+        classes = config.get('class', [])
+        self.classes = [classes] if isinstance(classes, str) else list(classes)
+        self.zone = config.get('zone')  # 归一化坐标 [x1, y1, x2, y2]，为空表示整帧
+        self.threshold = config.get('threshold', 0)
+        self.min_count = config.get('min_count', 1)
+        # dwell 规则使用 duration 作为持续时间，其他规则使用 hold 去抖
+        self.hold = config.get('duration', 5.0) if self.type == 'dwell' else config.get('hold', 0.5)
+        self.gap = config.get('gap', 0.5)          # 条件短暂中断（漏检）的容忍时间
+        self.cooldown = config.get('cooldown', 10.0)
+        self.actions = config.get('actions', ['log'])
+        unknown = [action for action in self.actions if action not in RULE_ACTIONS]
+        if unknown:
+            raise ValueError(f"规则 {self.name} 动作无效: {', '.join(unknown)}")
+
+        self.count = 0            # 当前帧计数
+        self.active_since = None  # 条件开始成立的时间
+        self.last_true = None     # 条件最近一次成立的时间
+        self.fired = False        # 本次条件成立期间是否已触发
+        self.last_fired = None
+
+    def in_zone(self, det, width, height):
+        """检测框中心点是否位于规则区域内"""
+        if not self.zone:
+            return True
+        x1, y1, x2, y2 = det['box']
+        cx, cy = (x1 + x2) / 2 / width, (y1 + y2) / 2 / height
+        zx1, zy1, zx2, zy2 = self.zone
+        return zx1 <= cx <= zx2 and zy1 <= cy <= zy2
+
+    def condition(self):
+        if self.type == 'count':
+            return self.count > self.threshold
+        return self.count >= self.min_count
+
+    def update(self, now):
+        """根据当前帧计数更新状态，满足去抖条件时返回 True"""
+        if self.condition():
+            if self.active_since is None or now - self.last_true > self.gap:
+                # 首次成立，或距上次成立已超过容忍时间（暂停检测、处理线程卡顿等），视为新的一段
+                self.active_since = now
+                self.fired = False
+            self.last_true = now
+        elif self.last_true is not None and now - self.last_true > self.gap:
+            # 条件中断超过容忍时间，重置状态
+            self.active_since = None
+            self.last_true = None
+            self.fired = False
+
+        # 只在当前帧条件成立时触发，持续时间按条件实际成立的区间计算
+        if not self.condition() or self.fired or self.last_true - self.active_since < self.hold:
+            return False
+        if self.last_fired is not None and now - self.last_fired < self.cooldown:
+            return False
+        self.fired = True
+        self.last_fired = now
+        return True
+
+    def describe(self):
+        if self.type == 'count':
+            return f"{self.name}: {'/'.join(self.classes) or '全部'} 数量 {self.count} > {self.threshold}"
+        if self.type == 'dwell':
+            return f"{self.name}: 区域内 {'/'.join(self.classes) or '目标'} 停留超过 {self.hold:g} 秒"
+        return f"{self.name}: 区域内出现 {'/'.join(self.classes) or '目标'}"
+
+
+class ActionDispatcher:
+    """在后台线程中执行告警动作，避免阻塞检测线程"""
+
+    def __init__(self, snapshot_dir='alerts', log_file='alerts.log', webhook_url=None):
+        self.snapshot_dir = snapshot_dir
+        self.log_file = log_file
+        self.webhook_url = webhook_url
+        self.queue = queue.Queue(maxsize=64)
+        Thread(target=self._worker, daemon=True).start()
+
+    def submit(self, rule, event, frame):
+        """提交告警动作，队列已满时直接丢弃"""
+        try:
+            self.queue.put_nowait((rule, event, frame))
+        except queue.Full:
+            print(f"告警动作队列已满，丢弃: {rule.name}")
+
+    def _worker(self):
+        while True:
+            rule, event, frame = self.queue.get()
+            for action in rule.actions:
+                try:
+                    if action == 'snapshot':
+                        self._snapshot(event, frame)
+                    elif action == 'log':
+                        self._log(event)
+                    elif action == 'webhook':
+                        self._webhook(event)
+                except Exception as e:
+                    print(f"告警动作 {action} 执行失败: {e}")
+
+    def _snapshot(self, event, frame):
+        if frame is None:
+            return
+        import cv2
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d_%H%M%S', time.localtime(event['time']))
+        path = os.path.join(self.snapshot_dir, f"{stamp}_{event['rule']}.jpg")
+        cv2.imwrite(path, cv2.cvtColor(frame, cv2.COLOR_RGB2BGR))
+        event['snapshot'] = path
+
+    def _log(self, event):
+        stamp = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(event['time']))
+        with open(self.log_file, 'a', encoding='utf-8') as f:
+            f.write(f"{stamp} [{event['rule']}] {event['message']}\n")
+
+    def _webhook(self, event):
+        if not self.webhook_url:
+            return
+        data = json.dumps(event, ensure_ascii=False).encode('utf-8')
+        request = urllib.request.Request(self.webhook_url, data=data,
+                                         headers={'Content-Type': 'application/json'})
+        urllib.request.urlopen(request, timeout=3).close()
+
+
+class RuleEngine:
+    """基于每帧结构化检测结果增量评估告警规则"""
+
+    def __init__(self, rules, dispatcher=None):
+        self.rules = rules
+        self.dispatcher = dispatcher
+        # 按类别索引规则，使每帧评估为 O(检测数量)
+        self.rules_by_class = {}
+        self.any_class_rules = []
+        for rule in rules:
+            if rule.classes:
+                for label in rule.classes:
+                    self.rules_by_class.setdefault(label, []).append(rule)
+            else:
+                self.any_class_rules.append(rule)
+
+    def process(self, detections, frame, now=None):
+        """评估一帧检测结果，返回本帧触发的告警事件列表"""
+        now = time.time() if now is None else now
+        height, width = frame.shape[:2]
+        for rule in self.rules:
+            rule.count = 0
+        for det in detections:
+            for rule in self.rules_by_class.get(det['label'], ()):
+                if rule.in_zone(det, width, height):
+                    rule.count += 1
+            for rule in self.any_class_rules:
+                if rule.in_zone(det, width, height):
+                    rule.count += 1
+
+        events = []
+        for rule in self.rules:
+            if rule.update(now):
+                event = {'rule': rule.name, 'type': rule.type, 'time': now,
+                         'count': rule.count, 'message': rule.describe()}
+                events.append(event)
+                if self.dispatcher:
+                    self.dispatcher.submit(rule, event, frame)
+        return events
+
+
+def load_rule_engine(config_file='rules.json'):
+    """从配置文件创建规则引擎，文件不存在时返回 None"""
+    if not os.path.exists(config_file):
+        return None
+    with open(config_file, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    rules = [Rule(item) for item in config.get('rules', [])]
+    webhook_rules = [rule.name for rule in rules if 'webhook' in rule.actions]
+    if webhook_rules and not config.get('webhook_url'):
+        raise ValueError(f"规则 {', '.join(webhook_rules)} 使用 webhook 动作，但未配置 webhook_url")
+    dispatcher = ActionDispatcher(
+        snapshot_dir=config.get('snapshot_dir', 'alerts'),
+        log_file=config.get('log_file', 'alerts.log'),
+        webhook_url=config.get('webhook_url'),
+    )
+    return RuleEngine(rules, dispatcher)
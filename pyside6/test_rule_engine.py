@@ -0,0 +1,94 @@
+import json
+
+import pytest
+
+from rule_engine import Rule, RuleEngine, load_rule_engine
+
+
+class Frame:
+    shape = (100, 100, 3)
+
+
+def person(x=50, y=50):
+    return {'label': 'person', 'box': [x - 5, y - 5, x + 5, y + 5]}
+
+
+def car():
+    return {'label': 'car', 'box': [10, 10, 20, 20]}
+
+
+def run(engine, frames):
+    """依次处理 (时间, 检测列表)，返回触发告警的时间"""
+    fired = []
+    for now, detections in frames:
+        if engine.process(detections, Frame(), now=now):
+            fired.append(now)
+    return fired
+
+
+def test_zone_rule_fires_after_hold():
+    engine = RuleEngine([Rule({'name': 'z', 'type': 'zone', 'class': 'person', 'hold': 0.5})])
+    assert run(engine, [(t / 10, [person()]) for t in range(10)]) == [0.5]
+
+
+def test_flicker_inside_gap_does_not_fire():
+    engine = RuleEngine([Rule({'name': 'z', 'type': 'zone', 'class': 'person',
+                               'hold': 0.5, 'gap': 1.0})])
+    frames = [(0.0, [person()])] + [(t / 10, []) for t in range(1, 20)]
+    assert run(engine, frames) == []
+
+
+def test_count_rule_requires_condition_for_hold():
+    engine = RuleEngine([Rule({'name': 'c', 'type': 'count', 'class': 'car',
+                               'threshold': 3, 'hold': 1.0, 'gap': 1.0})])
+    frames = [(t / 10, [car()] * 4) for t in range(4)] + [(t / 10, []) for t in range(4, 15)]
+    assert run(engine, frames) == []
+
+    frames = [(2 + t / 10, [car()] * 4) for t in range(12)]
+    events = []
+    for now, detections in frames:
+        events += engine.process(detections, Frame(), now=now)
+    assert [event['count'] for event in events] == [4]
+
+
+def test_short_miss_inside_gap_keeps_timer():
+    engine = RuleEngine([Rule({'name': 'd', 'type': 'dwell', 'class': 'person',
+                               'duration': 1.0, 'gap': 0.5})])
+    frames = [(0.0, [person()]), (0.2, []), (0.4, [person()]), (0.8, [person()]), (1.0, [person()])]
+    assert run(engine, frames) == [1.0]
+
+
+def test_long_pause_starts_new_episode():
+    engine = RuleEngine([Rule({'name': 'd', 'type': 'dwell', 'class': 'person',
+                               'duration': 5.0, 'gap': 0.5})])
+    frames = [(t / 10, [person()]) for t in range(16)] + [(60.0, [person()]), (65.0, [person()])]
+    assert run(engine, frames) == []
+    frames = [(65.0 + t / 10, [person()]) for t in range(1, 50)]
+    assert run(engine, frames) == []
+    assert run(engine, [(70.0, [person()])]) == [70.0]
+
+
+def test_unknown_action_rejected():
+    with pytest.raises(ValueError):
+        Rule({'name': 'z', 'class': 'person', 'actions': ['snapshots']})
+
+
+def test_webhook_requires_url(tmp_path):
+    config = tmp_path / 'rules.json'
+    config.write_text(json.dumps({'rules': [{'name': 'z', 'class': 'person', 'actions': ['webhook']}]}),
+                      encoding='utf-8')
+    with pytest.raises(ValueError):
+        load_rule_engine(str(config))
+
+
+def test_zone_excludes_detections_outside():
+    engine = RuleEngine([Rule({'name': 'z', 'type': 'zone', 'class': 'person',
+                               'zone': [0.0, 0.0, 0.3, 0.3], 'hold': 0})])
+    assert run(engine, [(0.0, [person(80, 80)]), (0.1, [person(10, 10)])]) == [0.1]
+
+
+def test_cooldown_suppresses_refire():
+    engine = RuleEngine([Rule({'name': 'z', 'type': 'zone', 'class': 'person',
+                               'hold': 0, 'gap': 0.2, 'cooldown': 5.0})])
+    frames = [(0.0, [person()]), (1.0, []), (2.0, [person()]), (3.0, []), (6.0, [person()])]
+    assert run(engine, frames) == [0.0, 6.0]
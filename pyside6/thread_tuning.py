@@ -0,0 +1,199 @@
+import argparse
+import itertools
+import json
+import os
+import statistics
+import time
+from threading import Thread
+
+import cv2
+import numpy as np
+
+from model_variants import prepare_variant, is_fixed_size
+
+PROFILE_FILE = 'thread_profile.json'
+
+# 未校准时使用的默认配置（None 表示保持库的默认值）
+DEFAULT_PROFILE = {
+    'torch_threads': None,
+    'cv2_threads': None,
+    'workers': 1,
+}
+
+
+def load_profile(profile_file=PROFILE_FILE, model=None, variant=None):
+    """加载线程配置，文件不存在时返回默认配置
+
+    指定 model/variant 时，若配置是针对其他模型或变体校准的，则返回标记为过期的默认配置。
+    """
+    profile = dict(DEFAULT_PROFILE)
+    if os.path.exists(profile_file):
+        with open(profile_file, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if (model and saved.get('model') != model) or (variant and saved.get('variant') != variant):
+            profile['stale'] = True
+            return profile
+        profile.update(saved)
+    return profile
+
+
+def save_profile(profile, profile_file=PROFILE_FILE):
+    with open(profile_file, 'w', encoding='utf-8') as f:
+        json.dump(profile, f, indent=2, ensure_ascii=False)
+
+
+def apply_profile(profile):
+    """将线程配置应用到当前进程（torch 和 OpenCV 的线程池为进程全局）"""
+    import torch
+    if profile.get('torch_threads'):
+        torch.set_num_threads(profile['torch_threads'])
+    if profile.get('cv2_threads') is not None:
+        cv2.setNumThreads(profile['cv2_threads'])
+
+
+def describe_profile(profile):
+    """返回用于信息面板显示的线程配置文本"""
+    import torch
+    if profile.get('stale'):
+        source = '默认，已有配置与当前模型/变体不符，请重新校准'
+    else:
+        source = '已校准' if profile.get('calibrated_at') else '默认'
+    return (f"线程配置({source}): torch {torch.get_num_threads()} / "
+            f"OpenCV {cv2.getNumThreads()} / 工作线程 {profile.get('workers', 1)}")
+
+
+def candidate_threads(cpu_count):
+    """生成 torch intra-op 线程数候选值"""
+    values = {1, 2, 4, max(1, cpu_count // 2), cpu_count}
+    return sorted(v for v in values if v <= cpu_count)
+
+
+def load_frames(image_dir=None, count=16):
+    """加载基准测试帧：优先使用本地图片，否则生成随机帧"""
+    frames = []
+    if image_dir and os.path.isdir(image_dir):
+        for name in sorted(os.listdir(image_dir)):
+            img = cv2.imread(os.path.join(image_dir, name))
+            if img is not None:
+                frames.append(img)
+            if len(frames) >= count:
+                break
+    if not frames:
+        print("警告: 未提供可用的测试图片（--images），使用随机噪声帧。"
+              "噪声帧几乎没有检测结果，NMS和后处理的耗时不会被测量到。")
+        rng = np.random.default_rng(0)
+        frames = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(count)]
+    return frames
+
+
+def benchmark(models, frames, torch_threads, cv2_threads, workers, frames_per_worker, imgsz=None):
+    """在给定线程组合下运行检测，返回吞吐量和延迟统计"""
+    import torch
+    if torch_threads:
+        torch.set_num_threads(torch_threads)
+    cv2.setNumThreads(cv2_threads)
+    kwargs = {'verbose': False}
+    if imgsz:
+        kwargs['imgsz'] = imgsz
+    latencies = []
+
+    def worker(model):
+        for i in range(frames_per_worker):
+            # 与检测窗口相同的预处理，使OpenCV线程池也参与竞争
+            frame = cv2.resize(frames[i % len(frames)], (520, 400))
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            start = time.perf_counter()
+            model(frame, **kwargs)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    # 预热
+    for model in models[:workers]:
+        model(frames[0], **kwargs)
+
+    start = time.perf_counter()
+    threads = [Thread(target=worker, args=(model,)) for model in models[:workers]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    median = statistics.median(latencies)
+    p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return {
+        'fps': len(latencies) / elapsed,
+        'median_ms': median,
+        'p95_ms': p95,
+        'jitter': p95 / median,
+    }
+
+
+def calibrate(model_path='yolov8n.pt', image_dir=None, max_workers=2, frames_per_worker=20,
+              max_jitter=1.5, profile_file=PROFILE_FILE, variant='fp32', calib_data='coco8.yaml'):
+    """对 torch 线程数、OpenCV 线程数和工作线程数的组合进行基准测试，保存最佳配置
+
+    基准测试使用实际部署的模型变体及其输入尺寸。
+    """
+    from ultralytics import YOLO
+    cpu_count = os.cpu_count() or 1
+    frames = load_frames(image_dir)
+    path, imgsz = prepare_variant(model_path, variant, calib_data)
+    models = [YOLO(path, task='detect') for _ in range(max_workers)]
+
+    # INT8 变体由 OpenVINO 运行，torch 线程数对推理没有影响，只校准其余参数
+    if is_fixed_size(variant):
+        print(f"模型变体 {variant} 使用 OpenVINO 推理，跳过 torch 线程数校准")
+        torch_candidates = [None]
+    else:
+        torch_candidates = candidate_threads(cpu_count)
+
+    results = []
+    combos = itertools.product(torch_candidates, (0, 1, 2), range(1, max_workers + 1))
+    for torch_threads, cv2_threads, workers in combos:
+        # 总线程数明显超过核心数的组合没有意义
+        if (torch_threads or 1) * workers > cpu_count * 2:
+            continue
+        stats = benchmark(models, frames, torch_threads, cv2_threads, workers, frames_per_worker, imgsz)
+        stats.update(torch_threads=torch_threads, cv2_threads=cv2_threads, workers=workers)
+        results.append(stats)
+        print(f"torch={str(torch_threads):<4} cv2={cv2_threads} workers={workers}  "
+              f"{stats['fps']:6.1f} fps  中位 {stats['median_ms']:6.1f} ms  "
+              f"p95 {stats['p95_ms']:6.1f} ms  抖动 {stats['jitter']:.2f}")
+
+    # 在抖动可接受的组合中选择吞吐量最高的
+    stable = [r for r in results if r['jitter'] <= max_jitter] or results
+    best = max(stable, key=lambda r: r['fps'])
+    profile = {
+        'torch_threads': best['torch_threads'],
+        'cv2_threads': best['cv2_threads'],
+        'workers': best['workers'],
+        'fps': round(best['fps'], 2),
+        'p95_ms': round(best['p95_ms'], 2),
+        'cpu_count': cpu_count,
+        'model': model_path,
+        'variant': variant,
+        'calibrated_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+    }
+    save_profile(profile, profile_file)
+    print(f"最佳配置已保存到 {profile_file}: torch={profile['torch_threads']} "
+          f"cv2={profile['cv2_threads']} workers={profile['workers']}")
+    return profile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='推理线程配置校准')
+    parser.add_argument('--model', default=None, help='默认使用 cascade.json 中的门控模型')
+    parser.add_argument('--variant', default=None, help='默认使用 cascade.json 中的 gate_variant')
+    parser.add_argument('--images', default=None, help='用于基准测试的本地图片目录')
+    parser.add_argument('--max-workers', type=int, default=2)
+    parser.add_argument('--frames', type=int, default=20, help='每个工作线程的测试帧数')
+    args = parser.parse_args(argv)
+    from detection_cascade import load_cascade_config
+    config = load_cascade_config()
+    calibrate(args.model or config['gate_model'], args.images, args.max_workers, args.frames,
+              variant=args.variant or config['gate_variant'], calib_data=config['variant_calib_data'])
+
+
+if __name__ == "__main__":
+    main()